@@ -1,46 +1,233 @@
+import argparse
+import hashlib
+import json
+import numpy as np
+import queue
+import re
+import sqlite3
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 import time
 from rich.console import Console
 from rich.table import Table
 from rich.prompt import Prompt, Confirm
 from rich import print as rprint
-from difflib import SequenceMatcher
+from concurrent.futures import FIRST_COMPLETED, CancelledError, Future, ThreadPoolExecutor, wait
+from contextlib import closing
+from functools import lru_cache
+from rapidfuzz import fuzz
+from rapidfuzz.process import cpdist
+
+# orjson parses Ollama's responses faster when it's installed
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+# Bump when the generation prompts change so stale cached questions are ignored
+PROMPT_VERSION = 1
+CACHE_TTL = 7 * 24 * 60 * 60  # One week, in seconds
+# Tokens allowed for a single question and answer
+QUESTION_TOKENS = 80
+# Offload every layer to the GPU when there is one, and keep the model loaded
+# between requests instead of reloading it for each question. Ollama reloads
+# the model whenever num_ctx changes, so every request shares one context,
+# sized for the batch prompt and answers of a full board
+GENERATE_OPTIONS = {
+    "num_gpu": 99,
+    "num_ctx": 4096,
+    "temperature": 0.8,
+    "top_k": 40
+}
+KEEP_ALIVE = "10m"
+
+# Prefixes like "Answer:" or "A -" that the model puts before an answer. A bare
+# "a" needs a space after its separator, and a hyphen needs spaces around it,
+# so answers like "A-ha", "A-Team" or "a:10" are left alone
+_ANS_PREFIX_RE = re.compile(r'^\s*(?:answer\s*:|a\s*:(?=\s)|(?:answer|a)\s+-(?=\s))\s*', re.I)
+
+@lru_cache(maxsize=256)
+def _normalize(text):
+    """Normalize an answer for comparison"""
+    return text.lower().strip()
 
 class JeopardyGame:
-    def __init__(self):
+    def __init__(self, use_cache=True, cache_path=".jeopardy_cache.sqlite3",
+                 model=None, quant=None, warm=True):
         self.console = Console()
         self.categories = ["Science", "History", "Geography", "Arts", "Sports"]
         self.points = [100, 200, 300, 400, 500]
-        self.board = {}
+        self.category_index = {category: i for i, category in enumerate(self.categories)}
+        self.points_index = {points: i for i, points in enumerate(self.points)}
+        # The board is stored as parallel arrays: whether each cell has been
+        # answered, and a flat list of futures for each cell's question and
+        # answer, both indexed by category then points
+        self.answered = np.zeros((len(self.categories), len(self.points)), dtype=bool)
+        self.questions = []
+        # Cells still to be answered, so the game loop needn't scan the board
+        self._remaining = len(self.categories) * len(self.points)
         self.score = 0
-
-    def generate_question(self, category, points):
-        """Generate a question and answer using Ollama"""
-        prompt = f"""Generate a {category} trivia question worth {points} points.
+        # A quantization picks that variant of a tagged model, e.g. mistral:7b-instruct
+        # with q4_K_M runs mistral:7b-instruct-q4_K_M. Untagged names like mistral
+        # have no quantized variants, so the default model gains a tag when quantized
+        if model is None:
+            model = "mistral:7b-instruct" if quant else "mistral"
+        if quant:
+            if ":" not in model:
+                raise ValueError(f"A quantization needs a tagged model such as "
+                                 f"mistral:7b-instruct, not {model}")
+            model = f"{model}-{quant}"
+        self.model = model
+        self.max_concurrency = 8
+        # Questions are generated on worker threads, which queue their errors
+        # for the main thread to report instead of printing over the prompts
+        self.errors = queue.SimpleQueue()
+        # Generates the board's questions in the background, see initialize_board
+        self.executor = None
+        self._closed = threading.Event()
+        self.use_cache = use_cache
+        self.cache_path = cache_path
+
+        # Keep connections to Ollama alive across requests, with one pooled
+        # connection per concurrent request
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.max_concurrency,
+                              pool_maxsize=self.max_concurrency,
+                              max_retries=0)
+        self.session.mount('http://', adapter)
+
+        if warm:
+            self._warm()
+
+    def _warm(self):
+        """Load the model in the background so it's ready when generation starts"""
+        def load():
+            try:
+                # An empty prompt just loads the model without generating anything.
+                # It uses the generation options, num_ctx in particular, so the
+                # first real request doesn't make Ollama reload the model
+                self.session.post('http://localhost:11434/api/generate',
+                                  json={
+                                      "model": self.model,
+                                      "prompt": "",
+                                      "stream": False,
+                                      "keep_alive": KEEP_ALIVE,
+                                      "options": {
+                                          **GENERATE_OPTIONS,
+                                          "num_predict": 1
+                                      }
+                                  },
+                                  timeout=(10, 300))
+            except requests.exceptions.RequestException:
+                # Generation reports the error if Ollama really isn't available
+                pass
+
+        threading.Thread(target=load, daemon=True).start()
+
+    def _cache_key(self, category, points):
+        """Key a cached question by everything that affects its generation"""
+        key = f"{self.model}|{category}|{points}|{PROMPT_VERSION}"
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _connect_cache(self):
+        """Open the question cache, creating it if needed"""
+        conn = sqlite3.connect(self.cache_path)
+        conn.execute("""CREATE TABLE IF NOT EXISTS questions (
+            key TEXT PRIMARY KEY,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            expires REAL NOT NULL)""")
+        return conn
+
+    def get_cached_question(self, category, points):
+        """Return the cached question for a cell, or None if there isn't a fresh one"""
+        if not self.use_cache:
+            return None
+        try:
+            with closing(self._connect_cache()) as conn:
+                row = conn.execute(
+                    "SELECT question, answer FROM questions WHERE key = ? AND expires > ?",
+                    (self._cache_key(category, points), time.time())).fetchone()
+        except sqlite3.Error:
+            # A broken cache shouldn't stop the game, just generate instead
+            return None
+        if row is None:
+            return None
+        return {
+            "question": row[0],
+            "answer": row[1]
+        }
+
+    def cache_question(self, category, points, qa_pair):
+        """Store a generated question so later games can reuse it"""
+        if not self.use_cache:
+            return
+        try:
+            with closing(self._connect_cache()) as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO questions VALUES (?, ?, ?, ?)",
+                    (self._cache_key(category, points), qa_pair["question"],
+                     qa_pair["answer"], time.time() + CACHE_TTL))
+        except sqlite3.Error:
+            pass
+
+    def _question_prompt(self, category, points):
+        """Build the prompt asking for a single question"""
+        return f"""Generate a {category} trivia question worth {points} points.
         Respond with only the question on one line, followed by the answer on the next line.
         Make it challenging but fair for the points value."""
 
+    def generate_question(self, category, points):
+        """Generate a question and answer using Ollama, reusing a cached one if available"""
+        cached = self.get_cached_question(category, points)
+        if cached is not None:
+            return cached
+
+        prompt = self._question_prompt(category, points)
+
         try:
-            response = requests.post('http://localhost:11434/api/generate',
+            response = self.session.post('http://localhost:11434/api/generate',
                                   json={
-                                      "model": "mistral",
+                                      "model": self.model,
                                       "prompt": prompt,
-                                      "stream": False
-                                  })
-            response.raise_for_status()
-            result = response.json()
+                                      "stream": True,
+                                      "keep_alive": KEEP_ALIVE,
+                                      "options": {
+                                          **GENERATE_OPTIONS,
+                                          "num_predict": QUESTION_TOKENS
+                                      }
+                                  },
+                                  timeout=(10, 300),
+                                  stream=True)
+            try:
+                response.raise_for_status()
+                text = ""
+                for chunk in response.iter_lines():
+                    if not chunk:
+                        continue
+                    result = json_loads(chunk)
+                    text += result.get('response', '')
+                    # Stop reading once both the question and answer lines are
+                    # complete, closing the response aborts the rest of the generation
+                    complete_lines = [line for line in text.split('\n')[:-1] if line.strip()]
+                    if result.get('done') or len(complete_lines) >= 2:
+                        break
+            finally:
+                response.close()
 
             # Split response into question and answer
-            lines = result['response'].strip().split('\n')
+            lines = [line for line in text.split('\n') if line.strip()]
             if len(lines) >= 2:
                 question = lines[0].strip()
-                answer = lines[1].strip()
                 # Remove common prefixes if they exist
-                answer = answer.lower().replace('answer:', '').replace('a:', '').strip()
-                return {
+                answer = _normalize(_ANS_PREFIX_RE.sub('', lines[1]))
+                qa_pair = {
                     "question": question,
                     "answer": answer
                 }
+                self.cache_question(category, points, qa_pair)
+                return qa_pair
             else:
                 # Fallback question if parsing fails
                 return {
@@ -49,63 +236,233 @@ class JeopardyGame:
                 }
 
         except Exception as e:
-            self.console.print(f"[red]Error generating question: {str(e)}[/red]")
+            self.errors.put(f"Error generating question: {str(e)}")
             # Provide a backup question
             return {
                 "question": f"This {category} question is worth ${points}",
                 "answer": "backup"
             }
 
-    def check_answer(self, player_answer: str, correct_answer: str) -> bool:
+    def prepare_answer(self, qa_pair):
+        """Add the normalized forms of a question's answer that check_answer compares against
+
+        Args:
+            qa_pair (dict): The question and answer
+
+        Returns:
+            dict: The question and answer along with the normalized answer,
+            its characters and its important words
+        """
+        normalized = _normalize(qa_pair["answer"])
+        return {
+            "question": qa_pair["question"],
+            "answer": qa_pair["answer"],
+            "normalized": normalized,
+            "characters": frozenset(normalized),
+            # Skip small words like "the", "a", etc.
+            "important_words": frozenset(word for word in normalized.split()
+                                         if len(word) > 3)
+        }
+
+    def check_answer(self, player_answer: str, correct_answer: str | dict) -> bool:
             """
             Check if the player's answer matches the correct answer using a more robust matching strategy.
 
             Args:
                 player_answer (str): The player's answer
-                correct_answer (str): The correct answer
+                correct_answer (str | dict): The correct answer, or a question
+                    already prepared by prepare_answer
 
             Returns:
                 bool: True if the answer is correct, False otherwise
             """
-            player_answer = player_answer.lower().strip()
-            correct_answer = correct_answer.lower().strip()
+            if isinstance(correct_answer, str):
+                correct_answer = self.prepare_answer({"question": "", "answer": correct_answer})
+            player_answer = _normalize(player_answer)
+            normalized = correct_answer["normalized"]
 
             # Direct match
-            if player_answer == correct_answer:
+            if player_answer == normalized:
                 return True
 
-            # Calculate similarity ratio
-            similarity = SequenceMatcher(None, player_answer, correct_answer).ratio()
-            if similarity > 0.8:  # 80% similarity threshold
+            # Calculate similarity ratio, the cutoff lets RapidFuzz bail out
+            # as soon as the threshold can't be reached. The ratio is at most
+            # 2 * shorter / (both lengths), so skip it when the lengths alone
+            # rule out a match or the answers have no characters in common
+            shorter = min(len(player_answer), len(normalized))
+            if 2 * shorter > 0.8 * (len(player_answer) + len(normalized)) \
+                    and not correct_answer["characters"].isdisjoint(player_answer):
+                similarity = fuzz.ratio(player_answer, normalized, score_cutoff=80) / 100.0
+                if similarity > 0.8:  # 80% similarity threshold
+                    return True
+
+            # Handle cases where one answer is a more specific version of the other:
+            # check if all important words from the correct answer are in the player's answer
+            important_words = correct_answer["important_words"]
+            if important_words and important_words.issubset(player_answer.split()):
                 return True
 
-            # Handle cases where one answer is a more specific version of the other
-            player_words = set(player_answer.split())
-            correct_words = set(correct_answer.split())
+            return False
 
-            # Check if all important words from the correct answer are in the player's answer
-            important_words = {word for word in correct_words
-                             if len(word) > 3}  # Skip small words like "the", "a", etc.
-            if important_words and important_words.issubset(player_words):
-                return True
+    def check_answers_batch(self, player_answers: list[str], correct_answers: list[str | dict]) -> list[bool]:
+            """
+            Check many player answers against their correct answers at once.
 
-            return False
+            Applies the same rules as check_answer, but scores the similarity of
+            every pair in a single RapidFuzz call.
+
+            Args:
+                player_answers (list[str]): The players' answers
+                correct_answers (list[str | dict]): The correct answer for each
+                    player answer, or questions already prepared by prepare_answer
+
+            Returns:
+                list[bool]: Whether each player answer is correct
+            """
+            if not player_answers:
+                return []
+            correct_answers = [self.prepare_answer({"question": "", "answer": answer})
+                               if isinstance(answer, str) else answer
+                               for answer in correct_answers]
+            player_answers = [_normalize(answer) for answer in player_answers]
+
+            # Only score the pairs whose lengths allow a match, like check_answer
+            player_lengths = np.array([len(answer) for answer in player_answers])
+            correct_lengths = np.array([len(answer["normalized"]) for answer in correct_answers])
+            candidates = np.flatnonzero(2 * np.minimum(player_lengths, correct_lengths)
+                                        > 0.8 * (player_lengths + correct_lengths))
+
+            similarities = np.zeros(len(player_answers))
+            if candidates.size:
+                similarities[candidates] = cpdist(
+                    [player_answers[i] for i in candidates],
+                    [correct_answers[i]["normalized"] for i in candidates],
+                    scorer=fuzz.ratio, score_cutoff=80, workers=-1)
+
+            results = []
+            for player_answer, correct_answer, similarity in zip(
+                    player_answers, correct_answers, similarities):
+                important_words = correct_answer["important_words"]
+                results.append(
+                    player_answer == correct_answer["normalized"]
+                    or similarity > 80  # 80% similarity threshold
+                    or bool(important_words) and important_words.issubset(player_answer.split()))
+            return results
+
+    def generate_board(self, cells):
+        """Generate the questions and answers for several cells in a single Ollama request
+
+        Args:
+            cells (list): The (category, points) cells to generate
+
+        Returns:
+            dict: Maps (category, points) to a question/answer pair for each
+            cell that could be parsed from the response. Cells that are
+            missing or malformed are left out.
+        """
+        layout = {}
+        for category, points in cells:
+            layout.setdefault(category, {})[str(points)] = {"q": "...", "a": "..."}
+        prompt = f"""Generate Jeopardy trivia questions for the categories and points values below.
+        Make each question challenging but fair for its points value and keep each answer short.
+        Respond with only JSON in this shape: {json.dumps(layout)}"""
+
+        try:
+            response = self.session.post('http://localhost:11434/api/generate',
+                                  json={
+                                      "model": self.model,
+                                      "prompt": prompt,
+                                      "format": "json",
+                                      "stream": False,
+                                      "keep_alive": KEEP_ALIVE,
+                                      "options": {
+                                          **GENERATE_OPTIONS,
+                                          # Room for every question plus the JSON around them
+                                          "num_predict": QUESTION_TOKENS * len(cells)
+                                      }
+                                  },
+                                  timeout=(10, 300))
+            response.raise_for_status()
+            data = json_loads(json_loads(response.content)['response'])
+        except Exception as e:
+            self.errors.put(f"Error generating board: {str(e)}")
+            return {}
+
+        board = {}
+        if not isinstance(data, dict):
+            return board
+        for category, points in cells:
+            cell = data.get(category)
+            if isinstance(cell, dict):
+                cell = cell.get(str(points))
+            if not isinstance(cell, dict):
+                continue
+            question, answer = cell.get("q"), cell.get("a")
+            if isinstance(question, str) and isinstance(answer, str) \
+                    and question.strip() and answer.strip():
+                qa_pair = {
+                    "question": question.strip(),
+                    "answer": _normalize(_ANS_PREFIX_RE.sub('', answer))
+                }
+                self.cache_question(category, points, qa_pair)
+                board[(category, points)] = qa_pair
+        return board
+
+    def _generate_cell(self, batch, category, points):
+        """Take a cell's question from the batch request, or generate it on its own"""
+        qa_pair = batch.result().get((category, points))
+        if qa_pair is None:
+            # Don't start a new request once the game is over
+            if self._closed.is_set():
+                raise CancelledError()
+            qa_pair = self.generate_question(category, points)
+        return self.prepare_answer(qa_pair)
+
+    def _cell(self, category, points):
+        """Index of a cell in the flat list of questions"""
+        return self.category_index[category] * len(self.points) + self.points_index[points]
 
     def initialize_board(self):
-        """Initialize the game board with questions and answers"""
-        self.board = {}
+        """Initialize the game board, generating its questions in the background
+
+        Each cell holds a future for its question and answer, so the board can
+        be shown and played while the remaining questions are still generating.
+        """
+        # Uncached cells come from one batch request. Only the cells missing
+        # from its reply get their own request, capped so the local Ollama
+        # server isn't overloaded; OLLAMA_NUM_PARALLEL lets it serve them in parallel
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        executor = self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        futures = {}
         for category in self.categories:
-            self.console.print(f"Generating questions for {category}...")
-            self.board[category] = {}
             for points in self.points:
-                qa_pair = self.generate_question(category, points)
-                self.board[category][points] = {
-                    "question": qa_pair["question"],
-                    "answer": qa_pair["answer"],
-                    "answered": False
-                }
-                # Small delay to prevent overwhelming the API
-                time.sleep(0.5)
+                cached = self.get_cached_question(category, points)
+                if cached is not None:
+                    futures[(category, points)] = Future()
+                    futures[(category, points)].set_result(self.prepare_answer(cached))
+
+        missing = [(category, points)
+                   for category in self.categories
+                   for points in self.points
+                   if (category, points) not in futures]
+        if missing:
+            # Submitted first so it's running before any cell waits on it
+            batch = executor.submit(self.generate_board, missing)
+            for category, points in missing:
+                futures[(category, points)] = executor.submit(
+                    self._generate_cell, batch, category, points)
+
+        self.questions = [futures[(category, points)]
+                          for category in self.categories
+                          for points in self.points]
+        self.answered = np.zeros((len(self.categories), len(self.points)), dtype=bool)
+        self._remaining = len(self.questions)
+
+    def report_errors(self):
+        """Print the errors queued while generating questions"""
+        while not self.errors.empty():
+            self.console.print(f"[red]{self.errors.get()}[/red]")
 
     def display_board(self):
         """Display the game board using Rich"""
@@ -119,8 +476,10 @@ class JeopardyGame:
         for points in self.points:
             row = []
             for category in self.categories:
-                if self.board[category][points]["answered"]:
+                if self.answered[self.category_index[category], self.points_index[points]]:
                     row.append("[dim]----[/dim]")
+                elif not self.questions[self._cell(category, points)].done():
+                    row.append(f"[dim]${points}...[/dim]")
                 else:
                     row.append(f"${points}")
             table.add_row(*row)
@@ -128,6 +487,7 @@ class JeopardyGame:
         self.console.clear()
         self.console.print(table)
         self.console.print(f"\nCurrent Score: ${self.score}")
+        self.report_errors()
 
     def play_turn(self):
             """Handle a single turn"""
@@ -139,63 +499,100 @@ class JeopardyGame:
             category = Prompt.ask("Choose a category", choices=self.categories)
 
             # Get points selection
-            available_points = [str(p) for p, q in self.board[category].items()
-                              if not q["answered"]]
+            available_points = [str(p) for p, answered
+                              in zip(self.points, self.answered[self.category_index[category]])
+                              if not answered]
             if not available_points:
                 rprint("[red]No more questions in this category![/red]")
                 return True
 
             points = int(Prompt.ask("Choose points", choices=available_points))
 
+            # Wait for the question if it's still being generated
+            future = self.questions[self._cell(category, points)]
+            if not future.done():
+                with self.console.status("Generating question..."):
+                    wait([future])
+            qa_pair = future.result()
+            self.report_errors()
+
             # Display question
-            question = self.board[category][points]["question"]
-            correct_answer = self.board[category][points]["answer"].lower()
+            question = qa_pair["question"]
+            correct_answer = qa_pair["answer"]
 
             self.console.print(f"\n[blue]Question ({category} for ${points}):[/blue]")
             self.console.print(question)
 
             # Get answer
-            player_answer = Prompt.ask("\nYour answer").lower()
+            player_answer = Prompt.ask("\nYour answer")
 
-            # Check answer using the new method
-            if self.check_answer(player_answer, correct_answer):
+            # Check answer against the answer normalized when the board was built
+            if self.check_answer(player_answer, qa_pair):
                 self.score += points
                 rprint("[green]Correct![/green]")
             else:
                 self.score -= points
                 rprint(f"[red]Sorry, the correct answer was: {correct_answer}[/red]")
-                time.sleep(2)
 
-            self.board[category][points]["answered"] = True
-            time.sleep(2)
+            self.answered[self.category_index[category], self.points_index[points]] = True
+            self._remaining -= 1
+            self.console.input("[dim]Press Enter to continue...[/dim]")
             return True
 
+    def close(self):
+        """Stop generating questions and release the connections to Ollama
+
+        Queued questions are cancelled so quitting doesn't wait for them, a
+        request that's already running still finishes.
+        """
+        self._closed.set()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
     def play_game(self):
         """Main game loop"""
         self.console.clear()
         rprint("[yellow]Welcome to Terminal Jeopardy![/yellow]")
         rprint("Initializing game board with Ollama...")
-        self.initialize_board()
+        try:
+            self.initialize_board()
 
-        while True:
-            self.display_board()
+            # Start as soon as the first question is ready, the rest keep generating.
+            # Cached cells are ready straight away, but uncached ones all come from
+            # the batch request, so a cold start waits for that whole request
+            with self.console.status("Generating questions..."):
+                wait(self.questions, return_when=FIRST_COMPLETED)
 
-            # Check if all questions are answered
-            all_answered = all(
-                question["answered"]
-                for category in self.board.values()
-                for question in category.values()
-            )
+            while True:
+                self.display_board()
 
-            if all_answered:
-                break
+                # Check if all questions are answered
+                if self._remaining == 0:
+                    break
 
-            if not self.play_turn():
-                rprint("\n[yellow]Thanks for playing![/yellow]")
-                break
+                if not self.play_turn():
+                    rprint("\n[yellow]Thanks for playing![/yellow]")
+                    break
 
-        self.console.print(f"\nGame Over! Final Score: ${self.score}")
+            self.console.print(f"\nGame Over! Final Score: ${self.score}")
+        finally:
+            # Also on Ctrl-C, so exiting doesn't wait for the rest of the board
+            self.close()
 
 if __name__ == "__main__":
-    game = JeopardyGame()
+    parser = argparse.ArgumentParser(description="A terminal Jeopardy game using Ollama")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="generate fresh questions instead of reusing cached ones")
+    parser.add_argument("--model",
+                        help="the Ollama model to generate questions with (default: mistral, "
+                             "or mistral:7b-instruct with --quant)")
+    parser.add_argument("--quant",
+                        help="the quantization of the model to use, e.g. q4_K_M")
+    args = parser.parse_args()
+
+    try:
+        game = JeopardyGame(use_cache=not args.no_cache, model=args.model, quant=args.quant)
+    except ValueError as e:
+        parser.error(str(e))
     game.play_game()
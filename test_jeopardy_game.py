@@ -1,4 +1,8 @@
+import json
+import threading
+import numpy as np
 import pytest
+from concurrent.futures import wait
 from unittest.mock import Mock, patch
 from rich.console import Console
 from rich.prompt import Prompt
@@ -6,8 +10,21 @@ import requests
 from jeopardy_game import JeopardyGame
 
 @pytest.fixture
-def game():
-    return JeopardyGame()
+def game(tmp_path):
+    return JeopardyGame(cache_path=tmp_path / "cache.sqlite3", warm=False)
+
+def wait_for_board(game):
+    """Wait for every question on the board to finish generating"""
+    wait(game.questions)
+
+def streamed_response(text, chunk_size=4):
+    """Mock a streamed Ollama response that sends the text a few characters at a time"""
+    chunks = [json.dumps({"response": text[i:i + chunk_size], "done": False}).encode()
+              for i in range(0, len(text), chunk_size)]
+    chunks.append(json.dumps({"response": "", "done": True}).encode())
+    response = Mock()
+    response.iter_lines.return_value = iter(chunks)
+    return response
 
 @pytest.fixture
 def mock_console():
@@ -16,7 +33,7 @@ def mock_console():
 
 @pytest.fixture
 def mock_requests():
-    with patch('requests.post') as mock:
+    with patch('requests.Session.post') as mock:
         yield mock
 
 def test_game_initialization(game):
@@ -25,15 +42,60 @@ def test_game_initialization(game):
     assert "Science" in game.categories
     assert 100 in game.points
     assert game.score == 0
-    assert isinstance(game.board, dict)
+    assert game.answered.shape == (len(game.categories), len(game.points))
+    assert not game.answered.any()
+    assert game.questions == []
+    assert isinstance(game.session, requests.Session)
+    assert game.session.get_adapter('http://localhost:11434')._pool_maxsize == game.max_concurrency
+
+@pytest.mark.parametrize("model,quant,expected", [
+    (None, None, "mistral"),
+    (None, "q4_K_M", "mistral:7b-instruct-q4_K_M"),
+    ("llama3.2", None, "llama3.2"),
+    ("mistral:7b-instruct", "q4_K_M", "mistral:7b-instruct-q4_K_M"),
+    ("llama3.2:3b-instruct", "q4_K_M", "llama3.2:3b-instruct-q4_K_M"),
+])
+def test_model_quantization(model, quant, expected):
+    """Test the quantization selects the matching model tag"""
+    assert JeopardyGame(model=model, quant=quant, warm=False).model == expected
+
+def test_model_quantization_needs_tag():
+    """Test quantizing an untagged model is rejected instead of naming a missing tag"""
+    with pytest.raises(ValueError):
+        JeopardyGame(model="mistral", quant="q4_K_M", warm=False)
+
+def test_warm(tmp_path, mock_requests):
+    """Test the model is loaded in the background when the game starts"""
+    loaded = threading.Event()
+    mock_requests.side_effect = lambda *args, **kwargs: loaded.set()
+
+    game = JeopardyGame(cache_path=tmp_path / "cache.sqlite3")
+    assert loaded.wait(5)
+    payload = mock_requests.call_args.kwargs["json"]
+    assert payload["model"] == game.model
+    assert payload["prompt"] == ""
+    assert payload["options"]["num_predict"] == 1
+
+def test_warm_matches_generation_options(tmp_path, mock_requests):
+    """Test the warm-up loads the model with the options generation uses"""
+    loaded = threading.Event()
+    mock_requests.side_effect = lambda *args, **kwargs: loaded.set()
+    game = JeopardyGame(cache_path=tmp_path / "cache.sqlite3")
+    assert loaded.wait(5)
+    warm_options = mock_requests.call_args.kwargs["json"]["options"]
+
+    mock_requests.side_effect = None
+    mock_requests.return_value = streamed_response('What is the capital of France?\nParis')
+    game.generate_question("Geography", 100)
+    generate_options = mock_requests.call_args.kwargs["json"]["options"]
+
+    # Only the output length differs, anything else would reload the model
+    del warm_options["num_predict"], generate_options["num_predict"]
+    assert warm_options == generate_options
 
 def test_generate_question_success(game, mock_requests):
     """Test successful question generation"""
-    mock_response = Mock()
-    mock_response.json.return_value = {
-        'response': 'What is the capital of France?\nParis'
-    }
-    mock_requests.return_value = mock_response
+    mock_requests.return_value = streamed_response('What is the capital of France?\nParis')
 
     result = game.generate_question("Geography", 100)
     assert isinstance(result, dict)
@@ -41,6 +103,49 @@ def test_generate_question_success(game, mock_requests):
     assert "answer" in result
     assert result["answer"] == "paris"
 
+    payload = mock_requests.call_args.kwargs["json"]
+    assert payload["stream"] is True
+    assert payload["keep_alive"] == "10m"
+    assert payload["options"]["num_predict"] == 80
+    assert payload["options"]["num_gpu"] == 99
+    assert payload["options"]["num_ctx"] == 4096
+
+@pytest.mark.parametrize("answer_line,expected", [
+    ("Paris", "paris"),
+    ("Answer: Paris", "paris"),
+    ("Answer:Paris", "paris"),
+    ("A: Paris", "paris"),
+    ("  answer - Paris  ", "paris"),
+    ("A - Paris", "paris"),
+    # Answers that only look like a prefix are kept whole
+    ("A-ha", "a-ha"),
+    ("A-Team", "a-team"),
+    ("a:10", "a:10"),
+])
+def test_generate_question_answer_prefix(game, mock_requests, answer_line, expected):
+    """Test answer prefixes are stripped from generated answers"""
+    mock_requests.return_value = streamed_response(f'What is the question?\n{answer_line}')
+
+    assert game.generate_question("Geography", 100)["answer"] == expected
+
+def test_generate_question_stops_streaming(game, mock_requests):
+    """Test the stream is closed once the question and answer lines are complete"""
+    mock_response = streamed_response('What is the capital of France?\n\nParis\nIt has been '
+                                      'the capital since the tenth century.')
+    chunks = mock_response.iter_lines.return_value
+    mock_requests.return_value = mock_response
+
+    result = game.generate_question("Geography", 100)
+    assert result == {"question": "What is the capital of France?", "answer": "paris"}
+    assert next(chunks, None) is not None
+    mock_response.close.assert_called_once()
+
+def test_generate_question_incomplete(game, mock_requests):
+    """Test a stream that ends before the answer line falls back to a backup question"""
+    mock_requests.return_value = streamed_response('What is the capital of France?')
+
+    assert game.generate_question("Geography", 100)["answer"] == "backup"
+
 def test_generate_question_error(game, mock_requests):
     """Test question generation with API error"""
     mock_requests.side_effect = requests.exceptions.RequestException()
@@ -51,6 +156,52 @@ def test_generate_question_error(game, mock_requests):
     assert "answer" in result
     assert result["answer"] == "backup"
 
+def test_generate_question_error_reported(game, mock_requests):
+    """Test generation errors are queued and reported later instead of printed"""
+    mock_requests.side_effect = requests.exceptions.RequestException("connection refused")
+
+    with patch.object(game.console, 'print') as mock_print:
+        game.generate_question("Geography", 100)
+        game.generate_board([("Science", 100)])
+        mock_print.assert_not_called()
+
+        game.report_errors()
+        messages = [call.args[0] for call in mock_print.call_args_list]
+    assert messages == ["[red]Error generating question: connection refused[/red]",
+                        "[red]Error generating board: connection refused[/red]"]
+    assert game.errors.empty()
+
+def test_generate_question_cached(game, mock_requests):
+    """Test a generated question is reused instead of asking Ollama again"""
+    mock_requests.return_value = streamed_response('What is the capital of France?\nParis')
+
+    first = game.generate_question("Geography", 100)
+    second = game.generate_question("Geography", 100)
+    assert second == first
+    assert mock_requests.call_count == 1
+
+    # Other cells and other models aren't served from the cache
+    assert game.get_cached_question("Geography", 200) is None
+    game.model = "other"
+    assert game.get_cached_question("Geography", 100) is None
+
+def test_generate_question_backup_not_cached(game, mock_requests):
+    """Test backup questions aren't cached"""
+    mock_requests.side_effect = requests.exceptions.RequestException()
+
+    game.generate_question("Geography", 100)
+    assert game.get_cached_question("Geography", 100) is None
+
+def test_generate_question_no_cache(tmp_path, mock_requests):
+    """Test the cache can be turned off"""
+    game = JeopardyGame(use_cache=False, cache_path=tmp_path / "cache.sqlite3", warm=False)
+    mock_requests.return_value = streamed_response('What is the capital of France?\nParis')
+
+    game.generate_question("Geography", 100)
+    game.generate_question("Geography", 100)
+    assert mock_requests.call_count == 2
+    assert not (tmp_path / "cache.sqlite3").exists()
+
 def test_answer_validation(game):
     """Test different answer matching scenarios"""
     test_cases = [
@@ -88,6 +239,11 @@ def test_answer_validation(game):
         ("mount everust", "mount everest", True),
     ]
 
+    # Check every case in one batch
+    results = game.check_answers_batch([case[0] for case in test_cases],
+                                       [case[1] for case in test_cases])
+    assert results == [case[2] for case in test_cases]
+
     for player_answer, correct_answer, expected in test_cases:
         result = game.check_answer(player_answer, correct_answer)
         assert result == expected, \
@@ -95,6 +251,33 @@ def test_answer_validation(game):
             f"correct_answer='{correct_answer}', " \
             f"expected={expected}, got={result}"
 
+        # Answers prepared at board build time match the same way
+        prepared = game.prepare_answer({"question": "", "answer": correct_answer})
+        assert game.check_answer(player_answer, prepared) == expected
+
+
+def test_answer_validation_batch_skips_lengths(game):
+    """Test pairs whose lengths rule out a match aren't scored in the batch"""
+    with patch('jeopardy_game.cpdist', return_value=np.array([100.0])) as mock_cpdist:
+        results = game.check_answers_batch(["new", "paris"], ["new york city", "paris"])
+
+        assert results == [False, True]
+        assert mock_cpdist.call_args.args == (["paris"], ["paris"])
+
+def test_answer_validation_batch_empty(game):
+    """Test an empty batch of answers"""
+    assert game.check_answers_batch([], []) == []
+
+@pytest.mark.parametrize("player_answer,correct_answer", [
+    ("new", "new york city"),
+    ("xyz", "paris"),
+])
+def test_answer_similarity_skipped(game, player_answer, correct_answer):
+    """Test answers that can't be similar enough skip the similarity ratio"""
+    with patch('jeopardy_game.fuzz.ratio') as mock_ratio:
+        assert game.check_answer(player_answer, correct_answer) is False
+        mock_ratio.assert_not_called()
+
 
 @pytest.mark.parametrize("points,expected", [
     (100, True),
@@ -106,7 +289,7 @@ def test_answer_validation(game):
 ])
 def test_valid_points(points, expected):
     """Test that only valid point values are accepted"""
-    game = JeopardyGame()
+    game = JeopardyGame(warm=False)
     assert (points in game.points) == expected
 
 def test_score_update(game):
@@ -121,30 +304,184 @@ def test_score_update(game):
     game.score -= 200
     assert game.score == initial_score - 100
 
+@pytest.mark.parametrize("player_answer,score", [
+    ("Paris", 100),
+    ("London", -100),
+])
+def test_play_turn(game, player_answer, score):
+    """Test a turn scores the answer and waits for the player instead of sleeping"""
+    with patch.object(game, 'generate_board', return_value={}), \
+         patch.object(game, 'generate_question') as mock_generate:
+        mock_generate.return_value = {"question": "Capital of France?", "answer": "paris"}
+        game.initialize_board()
+        wait_for_board(game)
+
+    with patch('jeopardy_game.Confirm.ask', return_value=True), \
+         patch('jeopardy_game.Prompt.ask', side_effect=["Geography", "100", player_answer]), \
+         patch.object(game.console, 'input') as mock_input, \
+         patch('time.sleep') as mock_sleep:
+        assert game.play_turn() is True
+
+        mock_input.assert_called_once()
+        mock_sleep.assert_not_called()
+    assert game.score == score
+    assert game.answered[game.category_index["Geography"], game.points_index[100]]
+    assert game.answered.sum() == 1
+    assert game._remaining == len(game.categories) * len(game.points) - 1
+
+def test_play_game_ends_when_all_answered(game):
+    """Test the game ends once every cell has been answered"""
+    def answer_all():
+        game._remaining -= 1
+        return True
+
+    with patch.object(game, 'initialize_board'), \
+         patch.object(game, 'display_board'), \
+         patch.object(game, 'play_turn', side_effect=answer_all) as mock_turn:
+        game.play_game()
+
+        assert mock_turn.call_count == len(game.categories) * len(game.points)
+
+def test_play_game_cancels_pending_questions(game):
+    """Test quitting cancels the questions still waiting to be generated"""
+    game.cache_question("Science", 100, {"question": "Cached question", "answer": "cached"})
+    release = threading.Event()
+
+    def slow_board(cells):
+        release.wait(5)
+        return {}
+
+    with patch.object(game, 'generate_board', side_effect=slow_board), \
+         patch.object(game, 'generate_question') as mock_generate, \
+         patch.object(game, 'display_board'), \
+         patch.object(game, 'play_turn', return_value=False), \
+         patch.object(game.session, 'close') as mock_close:
+        game.play_game()
+
+        # The cells queued behind the batch were cancelled
+        assert any(future.cancelled() for future in game.questions)
+        mock_close.assert_called_once()
+
+        # The ones already waiting on the batch don't start new requests
+        release.set()
+        wait([future for future in game.questions if not future.cancelled()])
+        mock_generate.assert_not_called()
+
 def test_board_initialization(game):
     """Test board structure after initialization"""
-    game.board = {}  # Clear any existing board
 
-    # Mock the generate_question method to avoid API calls
-    with patch.object(game, 'generate_question') as mock_generate:
+    # Mock the generate methods to avoid API calls
+    with patch.object(game, 'generate_board', return_value={}), \
+         patch.object(game, 'generate_question') as mock_generate:
         mock_generate.return_value = {
             "question": "Test question",
             "answer": "Test answer"
         }
 
         game.initialize_board()
+        wait_for_board(game)
 
         # Check board structure
-        assert len(game.board) == len(game.categories)
+        assert len(game.questions) == len(game.categories) * len(game.points)
+        assert game.answered.shape == (len(game.categories), len(game.points))
         for category in game.categories:
-            assert category in game.board
-            assert len(game.board[category]) == len(game.points)
             for points in game.points:
-                assert points in game.board[category]
-                assert "question" in game.board[category][points]
-                assert "answer" in game.board[category][points]
-                assert "answered" in game.board[category][points]
-                assert game.board[category][points]["answered"] == False
+                qa_pair = game.questions[game._cell(category, points)].result()
+                assert "question" in qa_pair
+                assert "answer" in qa_pair
+                assert qa_pair["normalized"] == "test answer"
+                assert qa_pair["important_words"] == {"test", "answer"}
+        assert not game.answered.any()
+
+def test_generate_board_success(game, mock_requests):
+    """Test batch generation keeps only the cells that parsed"""
+    data = {
+        "Science": {
+            "100": {"q": "What is H2O?", "a": "Water"},
+            "200": {"q": "", "a": "empty question"},
+        },
+        "History": "not a dict",
+    }
+    mock_response = Mock()
+    mock_response.content = json.dumps({'response': json.dumps(data)}).encode()
+    mock_requests.return_value = mock_response
+
+    result = game.generate_board([("Science", 100), ("Science", 200), ("History", 100)])
+    assert result == {("Science", 100): {"question": "What is H2O?", "answer": "water"}}
+    assert mock_requests.call_args.kwargs["json"]["format"] == "json"
+    # The batch shares the single-question context so the model isn't reloaded
+    assert mock_requests.call_args.kwargs["json"]["options"]["num_ctx"] == 4096
+
+def test_generate_board_invalid_json(game, mock_requests):
+    """Test batch generation with an unparseable response"""
+    mock_response = Mock()
+    mock_response.content = json.dumps({'response': 'not json'}).encode()
+    mock_requests.return_value = mock_response
+
+    assert game.generate_board([("Science", 100)]) == {}
+
+def test_board_initialization_fallback(game):
+    """Test cells missing from the batch are generated individually"""
+    batch = {(category, points): {"question": "Batch question", "answer": "batch"}
+             for category in game.categories
+             for points in game.points}
+    del batch[("Arts", 300)]
+
+    with patch.object(game, 'generate_board', return_value=batch), \
+         patch.object(game, 'generate_question') as mock_generate:
+        mock_generate.return_value = {
+            "question": "Single question",
+            "answer": "single"
+        }
+
+        game.initialize_board()
+        wait_for_board(game)
+
+        mock_generate.assert_called_once_with("Arts", 300)
+        assert game.questions[game._cell("Arts", 300)].result()["answer"] == "single"
+        assert game.questions[game._cell("Science", 100)].result()["answer"] == "batch"
+
+def test_board_initialization_background(game):
+    """Test the board is returned before its questions finish generating"""
+    release = threading.Event()
+
+    def slow_board(cells):
+        release.wait(5)
+        return {}
+
+    with patch.object(game, 'generate_board', side_effect=slow_board), \
+         patch.object(game, 'generate_question') as mock_generate:
+        mock_generate.return_value = {
+            "question": "Test question",
+            "answer": "Test answer"
+        }
+
+        game.initialize_board()
+        assert not game.questions[game._cell("Science", 100)].done()
+
+        release.set()
+        assert game.questions[game._cell("Science", 100)].result()["answer"] == "Test answer"
+        wait_for_board(game)
+
+def test_board_initialization_cached(game):
+    """Test only uncached cells are sent to the batch request"""
+    for category in game.categories:
+        for points in game.points:
+            if category != "Sports":
+                game.cache_question(category, points,
+                                    {"question": "Cached question", "answer": "cached"})
+    batch = {("Sports", points): {"question": "Batch question", "answer": "batch"}
+             for points in game.points}
+
+    with patch.object(game, 'generate_board', return_value=batch) as mock_board, \
+         patch.object(game, 'generate_question') as mock_generate:
+        game.initialize_board()
+        wait_for_board(game)
+
+        mock_board.assert_called_once_with([("Sports", points) for points in game.points])
+        mock_generate.assert_not_called()
+        assert game.questions[game._cell("Science", 100)].result()["answer"] == "cached"
+        assert game.questions[game._cell("Sports", 100)].result()["answer"] == "batch"
 
 if __name__ == "__main__":
     pytest.main([__file__])